@@ -5,6 +5,8 @@ Checks if PostgreSQL and RabbitMQ are running before starting the auth service.
 import psycopg2
 import pika
 import os
+import socket
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,9 +23,15 @@ def check_postgresql():
             host=postgres_host,
             database=postgres_db,
             user=postgres_user,
-            password=postgres_password
+            password=postgres_password,
+            port=os.environ.get("POSTGRES_PORT", "5432"),
+            connect_timeout=2
         )
-        conn.close()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+        finally:
+            conn.close()
         print("✅ PostgreSQL is running and accessible")
         return True
     except psycopg2.OperationalError as e:
@@ -36,7 +44,12 @@ def check_rabbitmq():
     try:
         rabbitmq_host = os.environ.get("RABBITMQ_URL", "localhost")
         connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=rabbitmq_host)
+            pika.ConnectionParameters(
+                host=rabbitmq_host,
+                connection_attempts=1,
+                socket_timeout=2,
+                blocked_connection_timeout=2
+            )
         )
         connection.close()
         print("✅ RabbitMQ is running and accessible")
@@ -46,11 +59,27 @@ def check_rabbitmq():
         print("   Please start RabbitMQ service")
         return False
 
+def check_tcp(name, host, port):
+    """Check if a TCP port accepts connections, without any protocol handshake"""
+    try:
+        with socket.create_connection((host, int(port)), timeout=1):
+            pass
+        print(f"✅ {name} port {port} is reachable")
+        return True
+    except OSError as e:
+        print(f"❌ {name} port {port} is NOT reachable: {e}")
+        return False
+
 if __name__ == "__main__":
     print("\n=== Checking External Services ===\n")
 
-    postgres_ok = check_postgresql()
-    rabbitmq_ok = check_rabbitmq()
+    if "--tcp" in sys.argv:
+        # Cheap liveness probe, only checks that both ports accept connections
+        postgres_ok = check_tcp("PostgreSQL", os.environ.get("POSTGRES_HOST", "localhost"), os.environ.get("POSTGRES_PORT", "5432"))
+        rabbitmq_ok = check_tcp("RabbitMQ", os.environ.get("RABBITMQ_URL", "localhost"), 5672)
+    else:
+        postgres_ok = check_postgresql()
+        rabbitmq_ok = check_rabbitmq()
 
     print("\n=== Summary ===")
     if postgres_ok and rabbitmq_ok:
@@ -59,3 +88,5 @@ if __name__ == "__main__":
         print("⚠️  Some services are not available.")
         print("   The auth service will start but may have limited functionality.")
         print("   Database-dependent endpoints will return 503 errors.")
+
+    sys.exit(0 if postgres_ok and rabbitmq_ok else 1)
@@ -1,9 +1,9 @@
-import sqlalchemy as _sql
+import sqlalchemy.ext.asyncio as _asyncio
 import sqlalchemy.ext.declarative as _declarative
-import sqlalchemy.orm as _orm
 from dotenv import load_dotenv
 import os
 import urllib.parse
+import uuid
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,15 +11,37 @@ load_dotenv()
 
 # Retrieve environment variables
 postgres_host = os.environ.get("POSTGRES_HOST")
+postgres_port = os.environ.get("POSTGRES_PORT", "5432")
 postgres_db = os.environ.get("POSTGRES_DB")
 postgres_user = os.environ.get("POSTGRES_USER")
 postgres_password = urllib.parse.quote(os.environ.get("POSTGRES_PASSWORD"))
+postgres_pgbouncer = os.environ.get("POSTGRES_PGBOUNCER", "false").lower() in ("1", "true", "yes")
 
 
 # Assuming your PostgreSQL server is running locally with a database named 'mydatabase'
-DATABASE_URL = f"postgresql://{postgres_user}:{postgres_password}@{postgres_host}/{postgres_db}"
+DATABASE_URL = f"postgresql+asyncpg://{postgres_user}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}"
 
 
-engine = _sql.create_engine(DATABASE_URL)
-SessionLocal = _orm.sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = _declarative.declarative_base()
\ No newline at end of file
+# PgBouncer in transaction mode hands each transaction a different server connection,
+# so asyncpg must not cache prepared statements and must give them unique names
+connect_args = {}
+if postgres_pgbouncer:
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
+# Size the pool for concurrent requests and drop dead connections before use
+engine = _asyncio.create_async_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    pool_size=int(os.environ.get("POSTGRES_POOL_SIZE", 20)),
+    max_overflow=int(os.environ.get("POSTGRES_MAX_OVERFLOW", 10)),
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+SessionLocal = _asyncio.async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+Base = _declarative.declarative_base()
@@ -1,14 +1,15 @@
 from typing import List
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse
 import fastapi as _fastapi
 import schemas as _schemas
-import sqlalchemy.orm as _orm
-import sqlalchemy.exc as _sa_exc
+import sqlalchemy as _sql
+import sqlalchemy.ext.asyncio as _asyncio
 import models as _models
 import service as _services
 import logging
-import database as _database
-import pika
+import os
+import aio_pika
 from contextlib import asynccontextmanager
 
 # Defer connections to startup
@@ -20,49 +21,50 @@ async def lifespan(app: _fastapi.FastAPI):
     global connection, channel
     # Try to create DB tables
     try:
-        _models.Base.metadata.create_all(bind=_database.engine)
+        await _services.create_database()
         logging.info("Database tables created or already exist")
     except Exception as e:
         logging.error(f"Failed to connect to database: {e}")
 
     # Try to connect to RabbitMQ
     try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
-        channel = connection.channel()
-        channel.queue_declare(queue='email_notification')
+        connection = await aio_pika.connect_robust(host=_services.RABBITMQ_URL)
+        # Keep one confirming channel for the process lifetime, OTP emails can be regenerated
+        # so the queue is a non-durable classic queue
+        channel = await connection.channel(publisher_confirms=True)
+        await channel.declare_queue('email_notification', durable=False)
         logging.info("Connected to RabbitMQ")
     except Exception as e:
         logging.error(f"Failed to connect to RabbitMQ: {e}")
     yield
+    if connection is not None:
+        await connection.close()
 
-def get_db():
-    db = _database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 app = _fastapi.FastAPI(lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 
+
+@app.exception_handler(_services.DatabaseUnavailable)
+async def database_unavailable_handler(request: _fastapi.Request, exc: _services.DatabaseUnavailable):
+    logging.error(f"Database is unavailable: {exc.__cause__}")
+    return JSONResponse(status_code=503, content={"detail": "Database service is unavailable"})
+
 @app.post("/api/users" ,  tags = ['User Auth'])
 async def create_user(
     user: _schemas.UserCreate,
-    db: _orm.Session = _fastapi.Depends(_services.get_db)):
-    try:
-        db_user = await _services.get_user_by_email(email=user.email, db=db)
+    db: _asyncio.AsyncSession = _fastapi.Depends(_services.get_db)):
+    db_user = await _services.get_user_by_email(email=user.email, db=db)
 
-        if db_user:
-            logging.info('User with that email already exists')
-            raise _fastapi.HTTPException(
-                status_code=200,
-                detail="User with that email already exists")
-        new_user = await _services.create_user(user=user, db=db)
+    if db_user:
+        logging.info('User with that email already exists')
+        raise _fastapi.HTTPException(
+            status_code=409,
+            detail="User with that email already exists")
+    new_user = await _services.create_user(user=user, db=db)
 
-        return _fastapi.HTTPException(
-            status_code=201,
-            detail="User Registered, Please verify email to activate account !")
-    except _services.DatabaseUnavailable:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
+    return JSONResponse(
+        status_code=201,
+        content={"detail": "User Registered, Please verify email to activate account !"})
 
 # Endpoint to check if the API is live
 @app.get("/check_api")
@@ -74,87 +76,58 @@ async def check_api():
 @app.post("/api/token" ,tags = ['User Auth'])
 async def generate_token(
     user_data: _schemas.GenerateUserToken,
-    db: _orm.Session = _fastapi.Depends(_services.get_db)):
-    try:
-        user = await _services.authenticate_user(email=user_data.username, password=user_data.password, db=db)
+    db: _asyncio.AsyncSession = _fastapi.Depends(_services.get_db)):
+    user = await _services.authenticate_user(email=user_data.username, password=user_data.password, db=db)
 
-        if user == "is_verified_false":
-            logging.info('Email verification is pending. Please verify your email to proceed. ')
-            raise _fastapi.HTTPException(
-                status_code=403, detail="Email verification is pending. Please verify your email to proceed.")
+    if user == "is_verified_false":
+        logging.info('Email verification is pending. Please verify your email to proceed. ')
+        raise _fastapi.HTTPException(
+            status_code=403, detail="Email verification is pending. Please verify your email to proceed.")
 
-        if not user:
-            logging.info('Invalid Credentials')
-            raise _fastapi.HTTPException(
-                status_code=401, detail="Invalid Credentials")
+    if not user:
+        logging.info('Invalid Credentials')
+        raise _fastapi.HTTPException(
+            status_code=401, detail="Invalid Credentials")
 
-        logging.info('JWT Token Generated')
-        return await _services.create_token(user=user)
-    except _services.DatabaseUnavailable:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
+    logging.info('JWT Token Generated')
+    return await _services.create_token(user=user)
 
 @app.get("/api/users/me", response_model=_schemas.User  , tags = ['User Auth'])
 async def get_user(user: _schemas.User = _fastapi.Depends(_services.get_current_user)):
     return user
 
 @app.get("/api/users/profile", tags=['User Auth'])
-async def get_user(email: str, db: _orm.Session = _fastapi.Depends(_services.get_db)):
-    try:
-        return db.query(_models.User).filter_by(id=1).first()
-    except _sa_exc.OperationalError:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
+async def get_user(email: str, db: _asyncio.AsyncSession = _fastapi.Depends(_services.get_db)):
+    result = await db.execute(_sql.select(_models.User).filter_by(id=1))
+    return result.scalars().first()
 
 @app.post("/api/users/generate_otp", response_model=str, tags=["User Auth"])
-async def send_otp_mail(userdata: _schemas.GenerateOtp, db: _orm.Session = _fastapi.Depends(_services.get_db)):
-    try:
-        user = await _services.get_user_by_email(email=userdata.email, db=db)
+async def send_otp_mail(userdata: _schemas.GenerateOtp, background_tasks: _fastapi.BackgroundTasks, db: _asyncio.AsyncSession = _fastapi.Depends(_services.get_db)):
+    # Generate OTP
+    otp = _services.generate_otp()
 
-        if not user:
+    # Store the OTP in the database, only look the user up again to report why it failed
+    if not await _services.store_otp(email=userdata.email, otp=otp, db=db):
+        if not await _services.get_user_by_email(email=userdata.email, db=db):
             raise _fastapi.HTTPException(status_code=404, detail="User not found")
+        raise _fastapi.HTTPException(status_code=400, detail="User is already verified")
 
-        if user.is_verified:
-            raise _fastapi.HTTPException(status_code=400, detail="User is already verified")
+    # Publish the OTP email after the response has been sent
+    background_tasks.add_task(_services.send_otp, userdata.email, otp, channel)
 
-        # Generate and send OTP
-        otp = _services.generate_otp()
-        print(otp)
-        _services.send_otp(userdata.email, otp, channel)
-
-        # Store the OTP in the database
-        user.otp = otp
-        db.add(user)
-        db.commit()
-
-        return "OTP sent to your email"
-    except _services.DatabaseUnavailable:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
-    except _sa_exc.OperationalError:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
+    return "OTP sent to your email"
 
 @app.post("/api/users/verify_otp", tags=["User Auth"])
-async def verify_otp(userdata: _schemas.VerifyOtp, db: _orm.Session = _fastapi.Depends(_services.get_db)):
-    try:
-        user = await _services.get_user_by_email(email=userdata.email, db=db )
-
-        if not user:
+async def verify_otp(userdata: _schemas.VerifyOtp, db: _asyncio.AsyncSession = _fastapi.Depends(_services.get_db)):
+    # Update user's is_verified field and clear the OTP
+    if not await _services.mark_user_verified(email=userdata.email, otp=userdata.otp, db=db):
+        if not await _services.get_user_by_email(email=userdata.email, db=db):
             raise _fastapi.HTTPException(status_code=404, detail="User not found")
+        raise _fastapi.HTTPException(status_code=400, detail="Invalid OTP")
 
-        if not user.otp or user.otp != userdata.otp:
-            raise _fastapi.HTTPException(status_code=400, detail="Invalid OTP")
-
-        # Update user's is_verified field
-        user.is_verified = True
-        user.otp = None  # Clear the OTP
-        db.add(user)
-        db.commit()
-
-        return "Email verified successfully"
-    except _services.DatabaseUnavailable:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
-    except _sa_exc.OperationalError:
-        raise _fastapi.HTTPException(status_code=503, detail="Database service is unavailable")
+    return "Email verified successfully"
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=5000, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=5000, workers=int(os.environ.get("WORKERS", 1)))
@@ -1,6 +1,8 @@
 import jwt
-import sqlalchemy.orm as _orm
+import sqlalchemy as _sql
+import sqlalchemy.ext.asyncio as _asyncio
 import sqlalchemy.exc as _sa_exc
+import asyncpg
 import passlib.hash as _hash
 import email_validator as _email_check
 import fastapi as _fastapi
@@ -10,22 +12,46 @@ import database as _database
 import schemas as _schemas
 import models as _models
 import random
+import asyncio
 import json
-import pika
-import time
+import logging
+import aio_pika
 import os
 import hashlib
+import socket
+import cachetools
+from concurrent.futures import ThreadPoolExecutor
 
 
 class DatabaseUnavailable(Exception):
     pass
 
 
+# Errors that mean Postgres cannot be reached or the pool is exhausted. asyncpg raises connect
+# failures (refused, DNS, connect timeout) unwrapped, so those are listed instead of all of OSError
+DATABASE_ERRORS = (
+    _sa_exc.OperationalError,
+    _sa_exc.InterfaceError,
+    _sa_exc.TimeoutError,
+    ConnectionError,
+    socket.gaierror,
+    TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+)
+
+
 # Load environment variables
 JWT_SECRET = os.getenv("JWT_SECRET")
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 oauth2schema = _security.OAuth2PasswordBearer("/api/token")
 
+# Dedicated pool for bcrypt so hashing neither blocks the event loop nor starves the default threadpool
+BCRYPT_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+
+# Authenticated users keyed by a digest of their token, saves a DB round-trip per request
+USER_CACHE = cachetools.TTLCache(maxsize=10000, ttl=300)
+
 
 def _prepare_password(password: str) -> str:
     """
@@ -38,52 +64,74 @@ def _prepare_password(password: str) -> str:
     return password
 
 
-def create_database():
+async def create_database():
     # Create database tables
-    return _database.Base.metadata.create_all(bind=_database.engine)
+    async with _database.engine.begin() as conn:
+        await conn.run_sync(_database.Base.metadata.create_all)
 
 
-def get_db():
-    # Dependency to get a database session
-    db = _database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    # Dependency to get a database session, connection failures surface as DatabaseUnavailable
+    async with _database.SessionLocal() as db:
+        try:
+            yield db
+        except DATABASE_ERRORS as e:
+            raise DatabaseUnavailable("Database is unavailable") from e
 
 
-async def get_user_by_email(email: str, db: _orm.Session):
+async def get_user_by_email(email: str, db: _asyncio.AsyncSession):
     # Retrieve a user by email from the database
-    try:
-        return db.query(_models.User).filter(_models.User.email == email and _models.User.is_verified == True).first()
-    except _sa_exc.OperationalError:
-        raise DatabaseUnavailable("Database is unavailable")
-
-
-async def create_user(user: _schemas.UserCreate, db: _orm.Session):
+    result = await db.execute(_sql.select(_models.User).where(_models.User.email == email))
+    return result.scalar_one_or_none()
+
+
+async def store_otp(email: str, otp: int, db: _asyncio.AsyncSession):
+    # Store an OTP for an unverified user in a single UPDATE, returns False if no row matched
+    result = await db.execute(
+        _sql.update(_models.User)
+        .where(_models.User.email == email, _models.User.is_verified.is_not(True))
+        .values(otp=otp)
+        .returning(_models.User.id))
+    updated = result.first() is not None
+    await db.commit()
+    return updated
+
+
+async def mark_user_verified(email: str, otp: int, db: _asyncio.AsyncSession):
+    # Verify the OTP and clear it in a single UPDATE, returns False if no row matched
+    result = await db.execute(
+        _sql.update(_models.User)
+        .where(_models.User.email == email, _models.User.otp == otp)
+        .values(is_verified=True, otp=None)
+        .returning(_models.User.id))
+    updated = result.first() is not None
+    await db.commit()
+    return updated
+
+
+async def create_user(user: _schemas.UserCreate, db: _asyncio.AsyncSession):
     # Create a new user in the database
     try:
-        valid = _email_check.validate_email(user.email)
+        # Syntax check only, MX lookups would add blocking DNS round-trips to every registration
+        valid = _email_check.validate_email(user.email, check_deliverability=False)
         name = user.name
         email = valid.email
     except _email_check.EmailNotValidError:
         raise _fastapi.HTTPException(status_code=404, detail="Please enter a valid email")
 
-    try:
-        # Prepare password for bcrypt (handles long passwords)
-        password_prepared = _prepare_password(user.password)
-        hashed_password = _hash.bcrypt.hash(password_prepared)
+    # Prepare password for bcrypt (handles long passwords)
+    password_prepared = _prepare_password(user.password)
+    hashed_password = await asyncio.get_running_loop().run_in_executor(
+        BCRYPT_POOL, _hash.bcrypt.hash, password_prepared)
 
-        user_obj = _models.User(email=email, name=name, hashed_password=hashed_password)
-        db.add(user_obj)
-        db.commit()
-        db.refresh(user_obj)
-        return user_obj
-    except _sa_exc.OperationalError:
-        raise DatabaseUnavailable("Database is unavailable")
+    user_obj = _models.User(email=email, name=name, hashed_password=hashed_password)
+    db.add(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
+    return user_obj
 
 
-async def authenticate_user(email: str, password: str, db: _orm.Session):
+async def authenticate_user(email: str, password: str, db: _asyncio.AsyncSession):
     # Authenticate a user
     user = await get_user_by_email(email=email, db=db)
 
@@ -93,7 +141,8 @@ async def authenticate_user(email: str, password: str, db: _orm.Session):
     if not user.is_verified:
         return 'is_verified_false'
 
-    if not user.verify_password(password):
+    password_ok = await asyncio.get_running_loop().run_in_executor(BCRYPT_POOL, user.verify_password, password)
+    if not password_ok:
         return False
 
     return user
@@ -108,39 +157,39 @@ async def create_token(user: _models.User):
     return dict(access_token=token, token_type="bearer")
 
 
-async def get_current_user(db: _orm.Session = _fastapi.Depends(get_db), token: str = _fastapi.Depends(oauth2schema)):
+async def get_current_user(db: _asyncio.AsyncSession = _fastapi.Depends(get_db), token: str = _fastapi.Depends(oauth2schema)):
     # Get the current authenticated user from the JWT token
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached_user = USER_CACHE.get(cache_key)
+    if cached_user is not None:
+        return cached_user
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        try:
-            user = db.query(_models.User).get(payload["id"])
-        except _sa_exc.OperationalError:
-            raise DatabaseUnavailable("Database is unavailable")
-    except:
+        user_id = payload["id"]
+    except (jwt.InvalidTokenError, KeyError):
         raise _fastapi.HTTPException(status_code=401, detail="Invalid Email or Password")
-    return _schemas.User.from_orm(user)
+
+    # Database errors are left to get_db so they are reported as 503 rather than 401
+    user = await db.get(_models.User, user_id)
+    if user is None:
+        raise _fastapi.HTTPException(status_code=401, detail="Invalid Email or Password")
+    user = _schemas.User.from_orm(user)
+    USER_CACHE[cache_key] = user
+    return user
 
 
 def generate_otp():
     # Generate a random OTP
-    return str(random.randint(100000, 999999))
+    return random.randint(100000, 999999)
 
 
-def connect_to_rabbitmq():
-    # Connect to RabbitMQ
-    while True:
-        try:
-            connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_URL))
-            return connection
-        except pika.exceptions.AMQPConnectionError:
-            print("Failed to connect to RabbitMQ. Retrying in 5 seconds...")
-            time.sleep(5)
-
+async def send_otp(email, otp, channel):
+    # Send an OTP email notification using the channel opened at startup
+    if channel is None:
+        logging.error("RabbitMQ channel is unavailable, OTP email not sent")
+        return
 
-def send_otp(email, otp, channel):
-    # Send an OTP email notification using RabbitMQ
-    connection = connect_to_rabbitmq()
-    channel = connection.channel()
     message = {'email': email,
                'subject': 'Account Verification OTP Notification',
                'other': 'null',
@@ -148,27 +197,13 @@ def send_otp(email, otp, channel):
                }
 
     try:
-        queue_declare_ok = channel.queue_declare(queue='email_notification', passive=True)
-        current_durable = queue_declare_ok.method.queue
-
-        if current_durable:
-            if queue_declare_ok.method.queue != current_durable:
-                channel.queue_delete(queue='email_notification')
-                channel.queue_declare(queue='email_notification', durable=True)
-        else:
-            channel.queue_declare(queue='email_notification', durable=True)
-
-        channel.basic_publish(
-            exchange="",
-            routing_key='email_notification',
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=json.dumps(message).encode(),
+                delivery_mode=aio_pika.DeliveryMode.NOT_PERSISTENT,
             ),
+            routing_key='email_notification',
         )
-        print("Sent OTP email notification")
+        logging.debug("Sent OTP email notification")
     except Exception as err:
-        print(f"Failed to publish message: {err}")
-    finally:
-        channel.close()
-        connection.close()
+        logging.error("Failed to publish message: %s", err)
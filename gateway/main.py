@@ -4,9 +4,8 @@ from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
 from jwt.exceptions import DecodeError
 from pydantic import BaseModel
-import requests
-import base64
-import pika
+import httpx
+import asyncio
 import logging
 import os
 import jwt
@@ -26,22 +25,30 @@ AUTH_BASE_URL = os.getenv("AUTH_BASE_URL")
 RABBITMQ_HOST = os.getenv("RABBITMQ_URL")
 
 # Defer RabbitMQ connection to startup
-connection = None
-channel = None
+ocr_rpc = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global connection, channel
-    # Try to connect to RabbitMQ
+    global ocr_rpc
+    # Try to connect to RabbitMQ, one RPC client is shared by all OCR requests
     try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue='gatewayservice')
-        channel.queue_declare(queue='ocr_service')
+        ocr_rpc = await rpc_client.OcrRpcClient().connect()
+        await ocr_rpc.channel.declare_queue('gatewayservice')
+        await ocr_rpc.channel.declare_queue('ocr_service')
         logging.info("Connected to RabbitMQ and declared queues")
     except Exception as e:
         logging.error(f"Failed to connect to RabbitMQ: {e}")
+
+    # Shared HTTP client so calls to the auth service reuse keep-alive connections
+    app.state.http = httpx.AsyncClient(
+        base_url=AUTH_BASE_URL,
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=50),
+    )
     yield
+    await app.state.http.aclose()
+    if ocr_rpc is not None:
+        await ocr_rpc.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -79,13 +86,15 @@ class VerifyOtp(BaseModel):
 @app.post("/auth/login", tags=["Authentication Service"])
 async def login(user_data: UserCredentials):
     try:
-        response = requests.post(f"{AUTH_BASE_URL}/api/token", json = {"username": user_data.username, "password": user_data.password})
+        response = await app.state.http.post("/api/token", json={"username": user_data.username, "password": user_data.password})
         if response.status_code == 200:
             return response.json()
         else:
             raise HTTPException(status_code=response.status_code, detail=response.json())
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Authentication service is unavailable")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Authentication service did not respond in time")
 
     except Exception as e:
         logging.error(f"Error during login: {e}")
@@ -94,14 +103,16 @@ async def login(user_data: UserCredentials):
 @app.post("/auth/register", tags=['Authentication Service'])
 async def registration(user_data:UserRegistration):
     try:
-        print(AUTH_BASE_URL)
-        response = requests.post(f"{AUTH_BASE_URL}/api/users", json = {"name": user_data.name, "email": user_data.email, "password": user_data.password})
+        logging.debug("Registering user via %s", AUTH_BASE_URL)
+        response = await app.state.http.post("/api/users", json={"name": user_data.name, "email": user_data.email, "password": user_data.password})
         if response.status_code == 201:
             return response.json()
         else:
             raise HTTPException(status_code=response.status_code, detail=response.json())
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Authentication service is unavailable")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Authentication service did not respond in time")
 
     except Exception as e:
         logging.error(f"Error during registration: {e}")
@@ -110,13 +121,15 @@ async def registration(user_data:UserRegistration):
 @app.post("/auth/generate_otp", tags=['Authentication Service'])
 async def generate_otp(user_data:GenerateOtp):
     try:
-        response = requests.post(f"{AUTH_BASE_URL}/api/users/generate_otp", json = {"email": user_data.email})
+        response = await app.state.http.post("/api/users/generate_otp", json={"email": user_data.email})
         if response.status_code == 200:
             return response.json()
         else:
             raise HTTPException(status_code=response.status_code, detail=response.json())
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Authentication service is unavailable")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Authentication service did not respond in time")
 
     except Exception as e:
         logging.error(f"Error during OTP generation: {e}")
@@ -125,13 +138,15 @@ async def generate_otp(user_data:GenerateOtp):
 @app.post("/auth/verify_otp", tags=['Authentication Service'])
 async def verify_otp(user_data:VerifyOtp):
     try:
-        response = requests.post(f"{AUTH_BASE_URL}/api/users/verify_otp", json={"email":user_data.email ,"otp":user_data.otp})
+        response = await app.state.http.post("/api/users/verify_otp", json={"email":user_data.email ,"otp":user_data.otp})
         if response.status_code == 200:
             return response.json()
         else:
             raise HTTPException(status_code=response.status_code, detail=response.json())
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Authentication service is unavailable")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Authentication service did not respond in time")
     except Exception as e:
         logging.error(f"Error during OTP verification: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -140,32 +155,27 @@ async def verify_otp(user_data:VerifyOtp):
 
 # ml microservice route - OCR route
 @app.post('/ocr' ,  tags=['Machine learning Service'] )
-def ocr(file: UploadFile = File(...),
+async def ocr(file: UploadFile = File(...),
         payload: dict = _fastapi.Depends(jwt_validation)):
-    # Save the uploaded file to a temporary location
-    with open(file.filename, "wb") as buffer:
-        buffer.write(file.file.read())
-
-    ocr_rpc = rpc_client.OcrRpcClient()
+    if ocr_rpc is None:
+        raise HTTPException(status_code=503, detail="Machine learning service is unavailable")
 
-    with open(file.filename, "rb") as buffer:
-        file_data = buffer.read()
-        file_base64 = base64.b64encode(file_data).decode()
+    # Read the upload once in memory, no temporary file is needed
+    file_data = await file.read()
 
-    request_json = {
+    request_headers = {
         'user_name': payload['name'],
         'user_email': payload['email'],
         'user_id': payload['id'],
-        'file': file_base64
     }
 
-    # Call the OCR microservice with the request JSON
-    response = ocr_rpc.call(request_json)
-
-    # Delete the temporary image file
-    os.remove(file.filename)
+    # Call the OCR microservice with the raw file as body and user details as headers
+    try:
+        response = await ocr_rpc.call(file_data, request_headers)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Machine learning service did not respond in time")
     return response
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=5001, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=5001, workers=int(os.environ.get("WORKERS", 1)))
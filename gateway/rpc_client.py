@@ -1,4 +1,5 @@
-import pika
+import aio_pika
+import asyncio
 import uuid
 import json
 from dotenv import load_dotenv
@@ -7,38 +8,50 @@ import os
 # Load environment variables
 load_dotenv()
 RABBITMQ_URL = os.environ.get("RABBITMQ_URL")
+# Seconds to wait for an OCR reply, generous because OCR itself is slow
+OCR_RPC_TIMEOUT = float(os.environ.get("OCR_RPC_TIMEOUT", 300))
 
 
 class OcrRpcClient:
     def __init__(self):
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_URL))
-        self.channel = self.connection.channel()
-
-        result = self.channel.queue_declare(queue='', exclusive=True)
-        self.callback_queue = result.method.queue
-
-        self.channel.basic_consume(
-            queue=self.callback_queue,
-            on_message_callback=self.on_response,
-            auto_ack=True
-        )
-
-    def on_response(self, ch, method, properties, body):
-        if self.corr_id == properties.correlation_id:
-            self.response = body
-
-    def call(self, image_data):
-        self.response = None
-        self.corr_id = str(uuid.uuid4())
-        self.channel.basic_publish(
-            exchange = '',
-            routing_key = 'ocr_service',
-            properties = pika.BasicProperties(
-                reply_to = self.callback_queue,
-                correlation_id = self.corr_id,
-            ),
-            body = json.dumps({'image_data': image_data})
-        )
-        while self.response is None:
-            self.connection.process_data_events()
-        return json.loads(self.response)
\ No newline at end of file
+        self.connection = None
+        self.channel = None
+        self.callback_queue = None
+        self.futures = {}
+
+    async def connect(self):
+        self.connection = await aio_pika.connect_robust(host=RABBITMQ_URL)
+        self.channel = await self.connection.channel()
+
+        self.callback_queue = await self.channel.declare_queue(exclusive=True)
+        await self.callback_queue.consume(self.on_response, no_ack=True)
+        return self
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+
+    async def on_response(self, message: aio_pika.abc.AbstractIncomingMessage):
+        future = self.futures.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(message.body)
+
+    async def call(self, file_data: bytes, headers: dict):
+        corr_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.futures[corr_id] = future
+
+        try:
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=file_data,
+                    content_type='application/octet-stream',
+                    headers=headers,
+                    reply_to=self.callback_queue.name,
+                    correlation_id=corr_id,
+                ),
+                routing_key='ocr_service',
+            )
+            return json.loads(await asyncio.wait_for(future, timeout=OCR_RPC_TIMEOUT))
+        finally:
+            self.futures.pop(corr_id, None)
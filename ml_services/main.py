@@ -20,7 +20,7 @@ def on_request(ch, method, props, body):
     # Initialize OCR service
     ocr_service = OCRService()
     # Process OCR request
-    response = ocr_service.process_request(body)
+    response = ocr_service.process_request(body, props.headers)
 
     # Send email notification
     send_email_notification(response['user_email'], response['ocr_text'], channel)
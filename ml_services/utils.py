@@ -1,5 +1,4 @@
 import json
-import base64
 import pandas as pd
 # keras ocr pipeline and imports
 import keras_ocr
@@ -18,18 +17,15 @@ class OCRService:
         sentence = ' '.join(words)
         return sentence
 
-    def process_request(self, message):
-        message_body = json.loads(message)
-        user_name = message_body['user_name']
-        user_email = message_body['user_email']
-        user_id = message_body['user_id']
-        file_base64 = message_body['file']
+    def process_request(self, file_data, headers):
+        user_name = headers['user_name']
+        user_email = headers['user_email']
+        user_id = headers['user_id']
         print(f" [x]user_id: {user_id} request recieved from gateway..")
         print(f" [x]processing request for {user_name}")
 
-        # Assuming file_base64 contains the base64-encoded string
-        file_data = base64.b64decode(file_base64.encode())
-        # Write the decoded file data to a new file
+        # The message body carries the raw file bytes
+        # Write the file data to a new file
         with open('artifacts/decoded_file.png', 'wb') as f:
             f.write(file_data)
 